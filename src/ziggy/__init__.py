@@ -7,7 +7,7 @@ This is work in progress, especially the public API of the package, that is at p
 quite heterogeneous.
 """
 
-from ziggy.parser import Parser, parse
+from ziggy.parser import Parser, parse, parse_many
 from ziggy.serializer import (
     AsMultilineStringFunc,
     AsQuotedStringFunc,
@@ -19,6 +19,7 @@ from ziggy.serializer import (
 
 __all__ = [
     "parse",
+    "parse_many",
     "serialize",
     "Parser",
     "Serializer",
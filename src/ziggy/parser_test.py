@@ -1,12 +1,23 @@
 from __future__ import annotations
 
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
 from typing import Any
 
 import pytest
 
-from ziggy.parser import parse
+from ziggy.parser import (
+    Parser,
+    _parse_document,
+    _parse_tree,
+    interpret_float,
+    interpret_integer,
+    parse,
+    parse_many,
+)
 
 
 @dataclass
@@ -30,6 +41,21 @@ class Location:
     longitude: float
 
 
+@dataclass(init=False)
+class Pair:
+    a: int
+    b: int
+
+    def __init__(self, b: int, a: int):
+        self.a = a
+        self.b = b
+
+
+class SwappedLocation(Location):
+    def __init__(self, longitude: float, latitude: float):
+        super().__init__(latitude, longitude)
+
+
 @pytest.mark.parametrize(
     "case_name, input, parser_options, expected",
     [
@@ -42,7 +68,7 @@ class Location:
                 [
                     3,
                     [
-                        255.171e-1,
+                        (0xFF + 0xAB / 16**2) * 2**-1,
                         {
                             "a": 1,
                             "b": ["alpha", "beta"],
@@ -144,6 +170,42 @@ class Location:
                 next=None,
             ),
         ),
+        (
+            "Dataclass fields in another order",
+            "Location { .longitude = 142.9, .latitude = 21.01 }",
+            {"structs": {"Location": Location}},
+            Location(latitude=21.01, longitude=142.9),
+        ),
+        (
+            "Dataclass with a custom __init__",
+            "Pair { .a = 1, .b = 2 }",
+            {"structs": {"Pair": Pair}},
+            Pair(b=2, a=1),
+        ),
+        (
+            "Dataclass subclass overriding __init__",
+            "Location { .latitude = 21.01, .longitude = 142.9 }",
+            {"structs": {"Location": SwappedLocation}},
+            SwappedLocation(longitude=142.9, latitude=21.01),
+        ),
+        (
+            "Single line multiline string",
+            """.a = \\\\hello
+            ,
+            .b = "world",
+            """,
+            {},
+            {"a": "hello", "b": "world"},
+        ),
+        (
+            "Comment after the last array element",
+            """[
+                1,
+                2, // Two.
+            ]""",
+            {},
+            [1, 2],
+        ),
     ],
 )
 def test_simple(
@@ -154,3 +216,165 @@ def test_simple(
 ):
     actual = parse(input, **parser_options)
     assert actual == expected
+
+
+def test_parser_mappings_added_after_construction():
+    parser = Parser()
+    parser.structs["Location"] = Location
+    parser.literals["date"] = lambda x: tuple(x.split("-"))
+    tree = _parse_document('[Location { .latitude = 1.0, .longitude = 2.0 }, @date("2024-11-24")]')
+    actual = parser.interpret(tree.root_node)
+    assert actual == [Location(latitude=1.0, longitude=2.0), ("2024", "11", "24")]
+
+
+def test_parse_many():
+    inputs = [
+        "Location { .latitude = 21.01, .longitude = 142.9 }",
+        '[Location { .latitude = 0.0, .longitude = 0.0 }, @date("2024-11-24")]',
+        b".latitude = 1.0, .longitude = 2.0",
+    ]
+    actual = list(
+        parse_many(
+            inputs,
+            structs={"Location": Location},
+            literals={"date": lambda x: tuple(x.split("-"))},
+        )
+    )
+    assert actual == [
+        Location(latitude=21.01, longitude=142.9),
+        [Location(latitude=0.0, longitude=0.0), ("2024", "11", "24")],
+        {"latitude": 1.0, "longitude": 2.0},
+    ]
+
+
+def test_parse_threads():
+    # Smoke test of concurrent parsing, of distinct and of identical inputs.
+    inputs = [f'[{i % 10}, "{i % 10}", {{ .i = {i % 10} }}]' for i in range(2000)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        actual = list(executor.map(parse, inputs))
+    assert actual == [[i % 10, str(i % 10), {"i": i % 10}] for i in range(2000)]
+
+
+def test_parse_tree_cache_is_per_thread():
+    s = b'[1, "cached"]'
+    tree = _parse_tree(s)
+    assert _parse_tree(s) is tree
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        other_thread_tree = executor.submit(_parse_tree, s).result()
+    assert other_thread_tree is not tree
+
+
+@pytest.mark.parametrize(
+    "input, locations",
+    [
+        # Nested error nodes at the same position are each reported.
+        ("[\n  1, 2 ;; 3,\n]", ["line 2, column 8", "line 2, column 8"]),
+        (b"[\n  1, 2 ;; 3,\n]", ["line 2, column 8", "line 2, column 8"]),
+        ("[1, ;; 2]", ["line 1, column 5", "line 1, column 5"]),
+        ('.a = 1,\n.b = {"k" 2}', ["line 2, column 7"]),
+        (
+            '.a = [1, ;;],\n.b = {"c": ;;},\n.c = ??',
+            [
+                "line 1, column 10",
+                "line 1, column 10",
+                "line 2, column 7",
+                "line 2, column 12",
+                "line 3, column 1",
+                "line 3, column 6",
+            ],
+        ),
+        (
+            '{"a": [1, ;; {"b": ;;}]}',
+            ["line 1, column 11", "line 1, column 11", "line 1, column 15", "line 1, column 20"],
+        ),
+    ],
+)
+def test_parse_error(input: str | bytes, locations: list[str]):
+    with pytest.raises(ValueError) as exc_info:
+        parse(input)
+    actual = re.findall(r"Error at (line \d+, column \d+):", str(exc_info.value))
+    assert actual == locations
+
+
+def test_parse_deeply_nested():
+    depth = 5000
+    actual = parse("[" * depth + "1" + "]" * depth)
+    for _ in range(depth):
+        assert isinstance(actual, list)
+        (actual,) = actual
+    assert actual == 1
+
+
+@pytest.mark.parametrize(
+    "input,expected",
+    [
+        # Base 10.
+        ("0", 0),
+        ("123", 123),
+        ("123_456", 123456),
+        ("007", 7),
+        ("-12", -12),
+        # Base 2.
+        ("0b0", 0),
+        ("0o0", 0),
+        ("0b0_0", 0),
+        ("0b10", 2),
+        ("0b1010", 10),
+        # Base 8.
+        ("0o0", 0),
+        ("0o7", 7),
+        ("0o10", 8),
+        ("0o12", 10),
+        # Base 16.
+        ("0x0", 0),
+        ("0xa", 10),
+        ("0xf", 15),
+        ("0x10", 16),
+        ("0xff", 255),
+        ("0xFF", 255),
+        ("0xFF_FF_FF", 16777215),
+        ("-0xff", -255),
+    ],
+)
+def test_interpret_integer(input: str, expected: int):
+    actual = interpret_integer(input)
+    assert actual == expected
+
+
+@pytest.mark.parametrize(
+    "input,expected",
+    [
+        # Base 10.
+        ("0", 0),
+        ("123", 123),
+        ("0.123", 0.123),
+        ("123_456", 123456),
+        ("123.456", 123.456),
+        ("123e456", 123e456),
+        ("12_3.45_6E1_2", 123.456e12),
+        ("123.0", 123.0),
+        ("123_000.456_000", 123_000.456_000),
+        ("123.0e+77", 123.0e77),
+        ("123.0E+77", 123.0e77),
+        # Base 16.
+        ("0x0", 0),
+        ("0xa", 10),
+        ("0xf", 15),
+        ("0x10", 16),
+        ("0xff", 255),
+        ("0xFF", 255),
+        ("0xFF_FF_FF", 16777215),
+        ("0x0.0", 0),
+        ("0x0.0p0", 0),
+        ("0x0.0p1", 0),
+        ("0xef.abp12", (0xEF + 0xAB / 16**2) * 2**12),
+        ("0xEF.ABp12", (0xEF + 0xAB / 16**2) * 2**12),
+        ("0x103.70p-5", (0x103 + 0x70 / 16**2) * 2**-5),
+        ("0x103.70", 0x103 + 0x70 / 16**2),
+        ("0x1234_5678.9ABC_CDEFp-10", (0x12345678 + 0x9ABCCDEF / 16**8) * 2**-10),
+        ("-0x1.8p1", -3.0),
+    ],
+)
+def test_interpret_float(input: str, expected: int):
+    actual = interpret_float(input)
+    assert math.isclose(actual, expected, abs_tol=1e-10)